@@ -1,22 +1,58 @@
+import functools
+import logging
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
-# Load environment variables from .env
-load_dotenv()
 
-# Determine the environment
-ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Stop pysqlite from managing transactions itself; it would defer BEGIN and break SAVEPOINTs
+    dbapi_connection.isolation_level = None
+    # WAL + NORMAL sync avoids an fsync of the rollback journal on every commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Keep temp tables in memory and read database pages through a 256 MiB memory map
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
 
-# Configure the database URL
-if ENVIRONMENT == "production":
-    DATABASE_URL = os.getenv("DATABASE_URL")
-else:
-    DATABASE_URL = f"sqlite:///{os.getcwd()}/test_pickler.db"  # Local SQLite database
 
-# Initialize SQLAlchemy engine and session
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def begin_sqlite_transaction(connection):
+    # With pysqlite's own handling disabled, SQLAlchemy has to emit BEGIN itself
+    connection.exec_driver_sql("BEGIN")
 
-print(f"Using {DATABASE_URL} for {ENVIRONMENT} environment.")
+
+@functools.lru_cache(maxsize=1)
+def get_engine():
+    """Create the SQLAlchemy engine on first use."""
+    # Load environment variables from .env
+    load_dotenv()
+
+    # Determine the environment
+    environment = os.getenv("ENVIRONMENT", "development")
+
+    # Configure the database URL
+    if environment == "production":
+        database_url = os.getenv("DATABASE_URL")
+    else:
+        database_url = f"sqlite:///{os.getcwd()}/test_pickler.db"  # Local SQLite database
+
+    engine = create_engine(database_url)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        event.listen(engine, "begin", begin_sqlite_transaction)
+
+    logging.info("Using %s for %s environment.", engine.url, environment)
+    return engine
+
+
+@functools.lru_cache(maxsize=1)
+def get_sessionmaker():
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+def get_session():
+    """Open a new database session bound to the shared engine."""
+    return get_sessionmaker()()
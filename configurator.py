@@ -1,19 +1,24 @@
-import json
+import functools
 import os
 import platform
 
+import orjson
 
+IS_WINDOWS = platform.system() == "Windows"
+
+
+@functools.lru_cache(maxsize=1)
 def load_config():
     try:
-        with open("config.json", "r", encoding="utf-8") as base_config_file:
-            config = json.load(base_config_file)
+        with open("config.json", "rb") as base_config_file:
+            config = orjson.loads(base_config_file.read())
     except FileNotFoundError:
         raise FileNotFoundError("Base configuration file not found.")
 
-    if platform.system() == "Windows" and os.path.exists("config.dev.json"):
+    if IS_WINDOWS and os.path.exists("config.dev.json"):
         try:
-            with open("config.dev.json", "r", encoding="utf-8") as dev_config_file:
-                dev_config = json.load(dev_config_file)
+            with open("config.dev.json", "rb") as dev_config_file:
+                dev_config = orjson.loads(dev_config_file.read())
                 config.update(dev_config)
         except FileNotFoundError:
             raise FileNotFoundError("Development configuration file not found.")
@@ -12,3 +12,11 @@ class SalesInfo(Base):
     broj_uplatitelja = Column(Integer)     # Number of participants
     data_hash = Column(Text)               # Hash of the JSON data
     json_data = Column(Text)               # JSON data as a string
+
+
+class PageCache(Base):
+    __tablename__ = "page_cache"
+
+    url = Column(String, primary_key=True)  # Sale page URL
+    etag = Column(String)                   # ETag of the last processed response
+    last_modified = Column(String)          # Last-Modified of the last processed response
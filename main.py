@@ -1,26 +1,51 @@
 #!/usr/bin/python3
 import datetime
+import functools
 import hashlib
-import json
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging.handlers import RotatingFileHandler
 
+import orjson
 import requests
-from deepdiff import DeepDiff
-from selectolax.parser import HTMLParser
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter, Retry
 
-from config import engine, SessionLocal
+from config import get_engine, get_session
 from configurator import load_config
-from data import Base, SalesInfo
+from data import Base, PageCache, SalesInfo
+from parsing import parse_html
 from urls import urls
 
 CONFIG = load_config()
 
+# Number of URLs fetched concurrently; parsing and DB work stay on the main thread
+FETCH_WORKERS = 16
+
+# (connect, read) seconds; an unreachable host fails fast instead of waiting out the read timeout
+REQUEST_TIMEOUT = (3, 10)
+
+# Records committed per transaction; bounds what a failed run loses without a commit per URL
+COMMIT_BATCH_SIZE = 10
+
+# Shared HTTP session so all fetches reuse pooled keep-alive connections
+HTTP_SESSION = requests.Session()
+# Retry transient failures with backoff; urllib3 never retries POSTs, so Telegram sends are not duplicated
+HTTP_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=FETCH_WORKERS,
+    pool_maxsize=FETCH_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+))
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler(CONFIG["log_files"]),
+        RotatingFileHandler(CONFIG["log_files"], maxBytes=10_000_000, backupCount=3),
         logging.StreamHandler()
     ]
 )
@@ -28,47 +53,64 @@ logging.basicConfig(
 
 def initialize_database():
     logging.info("Initializing database...")
-    Base.metadata.create_all(engine, checkfirst=True)
-    logging.info(f"Database initialized. Time: {datetime.datetime.now()}")
+    Base.metadata.create_all(get_engine(), checkfirst=True)
+    logging.info("Database initialized. Time: %s", datetime.datetime.now())
 
 
-def hash_data(json_input):
-    return hashlib.sha256(json.dumps(json_input, ensure_ascii=False).encode('utf-8')).hexdigest()
+def serialize_data(json_input):
+    # Sorted keys keep the hash stable if the page's field order shifts
+    return orjson.dumps(json_input, option=orjson.OPT_SORT_KEYS)
 
 
-def get_html(url):
-    """Fetch the HTML content from a URL."""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.text
-    except requests.RequestException as err:
-        logging.error(f"Failed to fetch URL {url}: {err}")
-        raise
+def hash_data(json_bytes):
+    # Change-detection fingerprint only, no security requirement
+    return hashlib.blake2b(json_bytes, digest_size=16).hexdigest()
 
 
-def parse_html(html_input):
-    """Parse HTML content and extract data."""
-    data = {}
-    html = HTMLParser(html_input)
+def get_html(url, headers=None):
+    """Fetch a URL; return the response, or None if the server reports it unchanged (304)."""
     try:
-        vrijednosti_lijevo = html.css(".main-container [role='main'] .row div p.text-right")
-        for vrijednost in vrijednosti_lijevo:
-            podaci_desno = vrijednost.parent.parent.css("div:nth-child(2) > p")
-            for podatak in podaci_desno:
-                key = vrijednost.text(strip=True)
-                value = podatak.text(strip=True) if podatak.text(strip=True) else "N/A"
-                data[key] = value
-
-        return data
-    except Exception as err:
-        logging.error(f"Failed to parse HTML: {err}")
+        response = HTTP_SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        return response
+    except requests.RequestException as err:
+        logging.error("Failed to fetch URL %s: %s", url, err)
         raise
 
 
-def update_if_changed(obj, attr, value):
-    if getattr(obj, attr) != value:
-        setattr(obj, attr, value)
+def read_page_cache(session, page_urls):
+    """Retrieve cached (etag, last_modified) validators for the given URLs in a single query."""
+    rows = session.query(PageCache.url, PageCache.etag, PageCache.last_modified).filter(
+        PageCache.url.in_(page_urls)).all()
+    return {row.url: (row.etag, row.last_modified) for row in rows}
+
+
+def conditional_headers(validators):
+    """Build If-None-Match / If-Modified-Since headers from cached validators."""
+    headers = {}
+    if validators is not None:
+        etag, last_modified = validators
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def write_page_cache(session, url, cached_validators, response_headers):
+    """Remember the validators of a processed response for the next run."""
+    validators = (response_headers.get("ETag"), response_headers.get("Last-Modified"))
+    if validators == (cached_validators or (None, None)):
+        return
+    etag, last_modified = validators
+    if cached_validators is None:
+        session.add(PageCache(url=url, etag=etag, last_modified=last_modified))
+    else:
+        # Plain UPDATE by key; no need to load (or reload, after a batch commit) the ORM row
+        session.query(PageCache).filter_by(url=url).update(
+            {"etag": etag, "last_modified": last_modified}, synchronize_session=False)
 
 
 def commit_session(session):
@@ -76,122 +118,247 @@ def commit_session(session):
         session.commit()
     except Exception as err:
         session.rollback()
-        logging.error(f"Failed to commit transaction: {err}")
+        logging.error("Failed to commit transaction: %s", err)
         raise
 
 
-def write_sales_info(session, data):
+def normalize_record_id(raw_id):
+    """Return a scraped 'ID nadmetanja' as the integer key, or None if it is not a number."""
+    # int() so "01" matches the stored key 1
+    raw_id = raw_id.strip()
+    return int(raw_id) if raw_id.isascii() and raw_id.isdigit() else None
+
+
+def write_sales_info(session, record_id, data, data_hash, json_bytes):
     """Write or update sales info in the database."""
-    data_hash = hash_data(data)  # Generate hash for the JSON data
-    json_data = json.dumps(data, ensure_ascii=False)  # Serialize the JSON data
-
-    # Check if the record already exists
-    existing_record = session.query(SalesInfo).filter_by(id=data["ID nadmetanja"]).first()
-
-    if existing_record:
-        logging.debug(f"Updating existing record for ID {data['ID nadmetanja']}.")
-        update_if_changed(existing_record, "iznos_najvise_ponude", data.get("iznos_najvise_ponude"))
-        update_if_changed(existing_record, "status_nadmetanja", data.get("status_nadmetanja", "UNKNOWN"))
-        update_if_changed(existing_record, "broj_uplatitelja", data.get("broj_uplatitelja"))
-        update_if_changed(existing_record, "data_hash", data_hash)
-        update_if_changed(existing_record, "json_data", json_data)
-        logging.info(f"Updated sales info for ID {data['ID nadmetanja']}.")
-    else:
-        logging.debug(f"Creating new record for ID {data['ID nadmetanja']}.")
-        new_record = SalesInfo(
-            id=data["ID nadmetanja"],
-            iznos_najvise_ponude=data.get("iznos_najvise_ponude"),
-            broj_uplatitelja=data.get("broj_uplatitelja"),
-            data_hash=data_hash,
-            json_data=json_data
-        )
-        session.add(new_record)
-    commit_session(session)
-
-
-def read_sales_info(session, id_nadmetanja):
-    """Retrieve sales info from the database."""
-    record = session.query(SalesInfo).filter_by(id=id_nadmetanja).first()
-    if record:
-        return {
-            "id": record.id,
-            "iznos_najvise_ponude": record.iznos_najvise_ponude,
-            "status_nadmetanja": record.status_nadmetanja,
-            "broj_uplatitelja": record.broj_uplatitelja,
-            "data_hash": record.data_hash,
-            "json_data": json.loads(record.json_data)  # Deserialize the JSON
-        }
-    return None
-
-
-def compare_and_notify_sales(session, new_data):
-    """Compare new sales data with existing records and notify changes."""
-    existing_data = read_sales_info(session, new_data["ID nadmetanja"])
-    if existing_data:
-        # Compare hashes to detect changes
-        if existing_data["data_hash"] != hash_data(new_data):
-            changes = DeepDiff(existing_data["json_data"], new_data)
-            send_to_telegram(f"Changes detected for ID {new_data['ID nadmetanja']}:\n{changes}")
-            logging.info(f"Changes detected and notified for ID {new_data['ID nadmetanja']}.")
-            write_sales_info(session, new_data)
-        else:
-            logging.info(f"No changes detected for ID {new_data['ID nadmetanja']}.")
-    else:
-        send_to_telegram(f"New entry detected: ID {new_data['ID nadmetanja']}")
-        logging.info(f"New sales info added for ID {new_data['ID nadmetanja']}.")
-        write_sales_info(session, new_data)
+    # merge() upserts by primary key; a row already loaded this run is updated without another SELECT
+    session.merge(SalesInfo(
+        id=record_id,
+        iznos_najvise_ponude=data.get("iznos_najvise_ponude"),
+        status_nadmetanja=data.get("status_nadmetanja", "UNKNOWN"),
+        broj_uplatitelja=data.get("broj_uplatitelja"),
+        data_hash=data_hash,
+        json_data=json_bytes.decode('utf-8')  # Decoded only when a row is actually written
+    ))
+    logging.debug("Wrote sales info for ID %s.", record_id)
+    # Flush inside the URL's savepoint so a failing write is rolled back on its own
+    session.flush()
+
+
+def flat_diff(old, new):
+    """Return {key: (old_value, new_value)} for every key whose value differs."""
+    # Parsed pages are flat str -> str dicts; keep page order, removed keys last
+    keys = list(new) + [key for key in old if key not in new]
+    return {key: (old.get(key), new.get(key)) for key in keys if old.get(key) != new.get(key)}
+
+
+def format_changes(changes):
+    return "\n".join(f"{key}: {old} -> {new}" for key, (old, new) in changes.items())
+
+
+def read_sales_hashes(session, ids):
+    """Retrieve stored data hashes for the given IDs in a single query."""
+    rows = session.query(SalesInfo.id, SalesInfo.data_hash).filter(SalesInfo.id.in_(ids)).all()
+    return {row.id: row.data_hash for row in rows}
+
+
+def compare_and_notify_sales(session, record_id, new_data, existing_hash):
+    """Compare new sales data with the stored record; return the notification to send, if any."""
+    # Serialized and hashed once, both reused for the write
+    json_bytes = serialize_data(new_data)
+    new_hash = hash_data(json_bytes)
+    if existing_hash is not None:
+        # Compare hashes to detect changes; the full record is loaded only on mismatch
+        if existing_hash != new_hash:
+            existing_record = session.get(SalesInfo, record_id)
+            changes = flat_diff(orjson.loads(existing_record.json_data), new_data)
+            write_sales_info(session, record_id, new_data, new_hash, json_bytes)
+            if not changes:
+                # Same content, only the stored hash is stale (e.g. serialization changed)
+                logging.info("Refreshing stored hash for ID %s.", record_id)
+                return None
+            logging.info("Changes detected for ID %s.", record_id)
+            return f"Changes detected for ID {record_id}:\n{format_changes(changes)}"
+        logging.info("No changes detected for ID %s.", record_id)
+        return None
+    write_sales_info(session, record_id, new_data, new_hash, json_bytes)
+    logging.info("New sales info added for ID %s.", record_id)
+    return f"New entry detected: ID {record_id}"
+
+
+def commit_batch(session, notifications):
+    """Commit the pending batch, then send its notifications; a failed commit does not stop the run."""
+    try:
+        commit_session(session)
+    except Exception:
+        # commit_session already rolled back and logged; these records are stored and notified next run
+        notifications.clear()
+        return
+    for message in notifications:
+        send_to_telegram(message)
+    notifications.clear()
 
 
 def process_urls(session):
     """Process all URLs and handle their data."""
-    for url in urls:
-        logging.info(f"Processing URL: {url}")
-        try:
-            raw_html = get_html(url)
-            data = parse_html(raw_html)
+    # dict.fromkeys drops duplicate URLs while keeping their order
+    unique_urls = list(dict.fromkeys(urls))
+    if len(unique_urls) != len(urls):
+        logging.warning("Skipping %s duplicate URL(s) in urls.py.", len(urls) - len(unique_urls))
+
+    # Cached validators let unchanged pages answer 304 without a body
+    page_cache = read_page_cache(session, unique_urls)
+
+    parsed = []
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        futures = {
+            executor.submit(get_html, url, conditional_headers(page_cache.get(url))): url
+            for url in unique_urls
+        }
+
+        # Parse each page as soon as it arrives so parsing overlaps the remaining downloads
+        for future in as_completed(futures):
+            url = futures[future]
+            logging.info("Processing URL: %s", url)
+            try:
+                response = future.result()
+                if response is None:
+                    logging.info("Page not modified since last run: %s. Skipping.", url)
+                    continue
+
+                # ponip.fina.hr serves UTF-8; hand the bytes to the parser and skip charset detection
+                data = parse_html(response.content)
+
+                logging.debug("Parsed data: %s", data)
+
+                if "ID nadmetanja" not in data:
+                    logging.warning("No 'ID nadmetanja' found for URL: %s. Skipping.", url)
+                    continue
+
+                record_id = normalize_record_id(data["ID nadmetanja"])
+                if record_id is None:
+                    # Keep a bad ID (e.g. "N/A" from an empty paragraph) out of the shared hash prefetch
+                    logging.warning("Non-numeric 'ID nadmetanja' %r for URL: %s. Skipping.",
+                                    data["ID nadmetanja"], url)
+                    continue
 
-            logging.debug(f"Parsed data: {data}")
+                parsed.append((url, record_id, data, response.headers))
 
-            if "ID nadmetanja" not in data:
-                logging.warning(f"No 'ID nadmetanja' found for URL: {url}. Skipping.")
-                continue
+            except Exception as err:
+                logging.error("Error processing URL %s: %s", url, err)
 
-            compare_and_notify_sales(session, data)
+    # One query for all stored hashes instead of a lookup per URL
+    existing_hashes = read_sales_hashes(session, [record_id for _, record_id, _, _ in parsed])
 
+    # Notifications wait until their records are committed, so a lost batch is not announced twice
+    notifications = []
+    for processed, (url, record_id, data, response_headers) in enumerate(parsed, start=1):
+        try:
+            # One SAVEPOINT per URL: a failed write rolls back this URL only, not the rest of the batch
+            with session.begin_nested():
+                message = compare_and_notify_sales(session, record_id, data, existing_hashes.get(record_id))
+                # Only cache validators once the page's data is stored, so a failed page is refetched in full
+                write_page_cache(session, url, page_cache.get(url), response_headers)
+            if message:
+                notifications.append(message)
         except Exception as err:
-            logging.error(f"Error processing URL {url}: {err}")
+            logging.error("Error processing URL %s: %s", url, err)
+
+        if processed % COMMIT_BATCH_SIZE == 0:
+            commit_batch(session, notifications)
+
+    commit_batch(session, notifications)
 
 
 def main():
     """Main entry point for the pickler app."""
     logging.info("Starting Ponip Pickler...")
-    session = SessionLocal()
+    session = get_session()
 
     try:
         process_urls(session)
     except Exception as err:
-        logging.error(f"Unhandled exception: {err}")
+        logging.error("Unhandled exception: %s", err)
     finally:
         session.close()
         logging.info("Database session closed.")
+        telegram_queue.join()  # Wait for queued notifications before exiting
         logging.info("Ponip Pickler finished execution.")
 
 
 # Telegram integration
+PONIP_URL = "https://ponip.fina.hr/ocevidnik-web/pretrazivanje/nekretnina"
+TELEGRAM_MAX_LENGTH = 4096  # Telegram's limit for a single message
+TELEGRAM_BATCH_WINDOW = 0.5  # Seconds to wait for more messages to merge into one POST
+TELEGRAM_SEPARATOR = "\n---\n"
+
+telegram_queue = queue.Queue()
+
+
 def send_to_telegram(content):
-    """Send a message to Telegram."""
+    """Queue a message for Telegram; a background thread sends it."""
+    if CONFIG["send_to_telegram"] == "1":
+        start_telegram_worker()
+        telegram_queue.put(content)
+
+
+def merge_messages(messages):
+    """Join messages into as few texts as fit in one Telegram message each."""
+    limit = TELEGRAM_MAX_LENGTH - len(PONIP_URL) - 1
+    merged = []
+    for message in messages:
+        if merged and len(merged[-1]) + len(TELEGRAM_SEPARATOR) + len(message) <= limit:
+            merged[-1] += TELEGRAM_SEPARATOR + message
+        else:
+            merged.append(message)
+    return merged
+
+
+@functools.lru_cache(maxsize=1)
+def telegram_credentials():
+    """Return (api_url, chat_id), reading creds on the first send only."""
+    # creds may read its tokens from the environment, so load .env before importing it;
+    # importing here also lets runs with sending disabled work without creds.py
+    load_dotenv()
     import creds
-    api_token = creds.TELEGRAM_API_TOKEN_TECH
-    chat_id = creds.TELEGRAM_CHAT_ID
-    api_url = f"https://api.telegram.org/bot{api_token}/sendMessage"
-    ponip_url = "https://ponip.fina.hr/ocevidnik-web/pretrazivanje/nekretnina"
+    return f"https://api.telegram.org/bot{creds.TELEGRAM_API_TOKEN_TECH}/sendMessage", creds.TELEGRAM_CHAT_ID
 
-    if CONFIG["send_to_telegram"] == "1":
-        try:
-            requests.post(api_url, json={'chat_id': chat_id, 'text': f"{content}\n{ponip_url}"})
-            logging.info("Message sent to Telegram.")
-        except Exception as err:
-            logging.error(f"Failed to send Telegram message: {err}")
+
+def post_to_telegram(content):
+    """Send a message to Telegram."""
+    try:
+        api_url, chat_id = telegram_credentials()
+        payload = {'chat_id': chat_id, 'text': f"{content}\n{PONIP_URL}"}
+        HTTP_SESSION.post(api_url, json=payload, timeout=REQUEST_TIMEOUT)
+        logging.info("Message sent to Telegram.")
+    except Exception as err:
+        logging.error("Failed to send Telegram message: %s", err)
+
+
+def telegram_worker():
+    """Send queued messages, merging those that arrive within TELEGRAM_BATCH_WINDOW."""
+    while True:
+        batch = [telegram_queue.get()]
+        deadline = time.monotonic() + TELEGRAM_BATCH_WINDOW
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(telegram_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        for content in merge_messages(batch):
+            post_to_telegram(content)
+        for _ in batch:
+            telegram_queue.task_done()
+
+
+@functools.lru_cache(maxsize=1)
+def start_telegram_worker():
+    """Start the sender thread on the first queued message, not at import."""
+    threading.Thread(target=telegram_worker, name="telegram", daemon=True).start()
 
 
 if __name__ == '__main__':
@@ -199,4 +366,4 @@ if __name__ == '__main__':
         initialize_database()
         main()
     except Exception as e:
-        logging.error(f"Unhandled exception: {e}")
+        logging.error("Unhandled exception: %s", e)
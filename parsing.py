@@ -0,0 +1,26 @@
+import logging
+
+from selectolax.lexbor import LexborHTMLParser
+
+# Left-column labels on a sale page; each label's row holds the matching values
+LABEL_SELECTOR = ".main-container [role='main'] .row div p.text-right"
+# Value paragraphs of a label's row, relative to the row
+VALUE_SELECTOR = "div:nth-child(2) > p"
+
+
+def parse_html(html_input):
+    """Parse HTML content and extract data."""
+    data = {}
+    html = LexborHTMLParser(html_input)
+    try:
+        vrijednosti_lijevo = html.css(LABEL_SELECTOR)
+        for vrijednost in vrijednosti_lijevo:
+            key = vrijednost.text(strip=True)
+            podaci_desno = vrijednost.parent.parent.css(VALUE_SELECTOR)
+            for podatak in podaci_desno:
+                data[key] = podatak.text(strip=True) or "N/A"
+
+        return data
+    except Exception as err:
+        logging.error("Failed to parse HTML: %s", err)
+        raise
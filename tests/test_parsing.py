@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from selectolax.parser import HTMLParser
+
+from parsing import parse_html
+
+FIXTURE = Path(__file__).parent / "fixtures" / "predmet_prodaje.html"
+
+
+def parse_html_modest(html_input):
+    """The original Modest-based extraction, kept as the reference behavior."""
+    data = {}
+    html = HTMLParser(html_input)
+    vrijednosti_lijevo = html.css(".main-container [role='main'] .row div p.text-right")
+    for vrijednost in vrijednosti_lijevo:
+        podaci_desno = vrijednost.parent.parent.css("div:nth-child(2) > p")
+        for podatak in podaci_desno:
+            key = vrijednost.text(strip=True)
+            value = podatak.text(strip=True) if podatak.text(strip=True) else "N/A"
+            data[key] = value
+    return data
+
+
+def test_parse_html_matches_original_extraction():
+    html = FIXTURE.read_bytes()
+    assert parse_html(html) == parse_html_modest(html.decode("utf-8"))
+
+
+def test_parse_html_fixture_values():
+    data = parse_html(FIXTURE.read_bytes())
+    assert data["ID nadmetanja"] == "12345"
+    assert data["Trenutačna cijena predmeta prodaje u nadmetanju"] == "120.000,00 EUR"
+    assert data["Broj uplatitelja jamčevine"] == "N/A"
+    # The last matching paragraph wins, including ones nested under the value column
+    assert data["Datum i vrijeme završetka nadmetanja"] == "Produljenje nadmetanja moguće"
+    assert data["Napomena"] == "Nekretnina se prodaje u viđenom stanju."
+    assert "Ostali uvjeti prodaje" not in data